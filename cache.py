@@ -0,0 +1,204 @@
+import os
+import pickle
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+
+# --------------------------------------------------------------------------------------------------
+# Key/value caches with LRU and TTL eviction
+# A read-through caller takes generation(key) before loading the value and passes it to set(),
+# the value is dropped if delete() or clear() ran in between, so a slow reader never stores data
+# older than the last invalidation
+# --------------------------------------------------------------------------------------------------
+class MemoryCache:
+    """In-process cache, entries expire after ttl seconds and the least recently used entry is
+    evicted once max_entries is reached
+    """
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        # bumped by delete() per key and by clear() for every key
+        self.generations = {}
+        self.epoch = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def generation(self, key):
+        with self.lock:
+            return self.epoch, self.generations.get(key, 0)
+
+    def set(self, key, value, generation=None):
+        with self.lock:
+            if generation is not None and generation != (self.epoch, self.generations.get(key, 0)):
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+                self.generations[key] = self.generations.get(key, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generations.clear()
+            self.epoch += 1
+
+    def purge_expired(self):
+        now = time.monotonic()
+        with self.lock:
+            for key in [key for key, (expires, _) in self.entries.items() if expires < now]:
+                del self.entries[key]
+
+
+class SharedCache:
+    """Cache kept in a local SQLite file so every worker process on the host shares the entries,
+    values are pickled. Each process opens its own connection on first use, after any fork
+    """
+    EVICT_EVERY = 64
+    # a hit only writes the access time back once it is this many seconds old, so most reads
+    # stay reads instead of competing for the write lock
+    TOUCH_AFTER = 60
+    GENERATION = 'coalesce((SELECT generation FROM generations WHERE key = ?), 0)'
+
+    def __init__(self, path, max_entries=10000, ttl=300):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.pid = None
+        self.conn = None
+        self.writes = 0
+        self.lock = Lock()
+
+    def connection(self):
+        if self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, timeout=15, isolation_level=None, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                              '(key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache (accessed)')
+            # the row with the empty key is bumped by clear(), the others by delete()
+            self.conn.execute('CREATE TABLE IF NOT EXISTS generations (key TEXT PRIMARY KEY, generation INTEGER)')
+            self.pid = os.getpid()
+        return self.conn
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            conn = self.connection()
+            row = conn.execute('SELECT value, expires, accessed FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                return None
+            if row[2] < now - self.TOUCH_AFTER:
+                conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(row[0])
+
+    def generation(self, key):
+        with self.lock:
+            return self.connection().execute(f'SELECT {self.GENERATION}, {self.GENERATION}', ('', key)).fetchone()
+
+    def set(self, key, value, generation=None):
+        now = time.time()
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            conn = self.connection()
+            if generation is None:
+                conn.execute('INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                             (key, data, now + self.ttl, now))
+            else:
+                # one statement, so no delete() from another process can land between check and insert
+                conn.execute('INSERT OR REPLACE INTO cache (key, value, expires, accessed) SELECT ?, ?, ?, ? '
+                             f'WHERE {self.GENERATION} = ? AND {self.GENERATION} = ?',
+                             (key, data, now + self.ttl, now, '', generation[0], key, generation[1]))
+            self.writes += 1
+            if self.writes % self.EVICT_EVERY == 0:
+                # keep the max_entries most recently used entries, to within TOUCH_AFTER seconds
+                conn.execute('DELETE FROM cache WHERE key IN '
+                             '(SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                             (self.max_entries,))
+
+    def bump(self, conn, keys):
+        conn.executemany('INSERT INTO generations (key, generation) VALUES (?, 1) '
+                         'ON CONFLICT (key) DO UPDATE SET generation = generation + 1', [(key,) for key in keys])
+
+    def delete(self, *keys):
+        with self.lock:
+            conn = self.connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany('DELETE FROM cache WHERE key = ?', [(key,) for key in keys])
+                self.bump(conn, keys)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def clear(self):
+        with self.lock:
+            conn = self.connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('DELETE FROM cache')
+                # a new epoch already changes every generation, so the per key counters can start over
+                conn.execute("DELETE FROM generations WHERE key != ''")
+                self.bump(conn, [''])
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def purge_expired(self):
+        with self.lock:
+            self.connection().execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+
+
+class NullCache:
+    """Stores nothing, used when caching is switched off"""
+    def get(self, key):
+        return None
+
+    def generation(self, key):
+        return None
+
+    def set(self, key, value, generation=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def purge_expired(self):
+        pass
+
+
+def make_cache(backend, path=None, max_entries=1024, ttl=300):
+    if backend == 'memory':
+        return MemoryCache(max_entries, ttl)
+    if backend == 'shared':
+        return SharedCache(path, max_entries, ttl)
+    if backend == 'none':
+        return NullCache()
+    raise ValueError(f'Unknown cache backend {backend}')
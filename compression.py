@@ -0,0 +1,124 @@
+import gzip
+import zlib
+from flask import Response, current_app, request
+from cache import MemoryCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --------------------------------------------------------------------------------------------------
+# Negotiated gzip/brotli response compression
+# Responses are compressed in an after_request hook, streamed responses chunk by chunk, and
+# representations stored with store_representation() are compressed once per encoding
+# --------------------------------------------------------------------------------------------------
+ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+
+
+def init_compression(app):
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_LEVEL', 4)
+    app.config.setdefault('COMPRESS_MIMETYPES', ['application/json', 'text/html', 'text/plain',
+                                                 'text/css', 'application/javascript'])
+    app.config.setdefault('REPRESENTATION_CACHE_SIZE', 256)
+    app.config.setdefault('REPRESENTATION_CACHE_TTL', 60)
+    app.extensions['representations'] = MemoryCache(app.config['REPRESENTATION_CACHE_SIZE'],
+                                                    app.config['REPRESENTATION_CACHE_TTL'])
+    app.after_request(compress_response)
+
+
+def negotiate():
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def compressible(response):
+    return (response.mimetype in current_app.config['COMPRESS_MIMETYPES']
+            and 200 <= response.status_code < 300
+            and 'Content-Encoding' not in response.headers)
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['COMPRESS_BR_LEVEL'])
+    return gzip.compress(data, compresslevel=current_app.config['COMPRESS_LEVEL'])
+
+
+def stream_compress(chunks, encoding, level):
+    # runs after the request context is gone, so the level is passed in
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        # wbits 31 writes the gzip header and trailer
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            # a sync flush hands every chunk to the client as soon as it is produced
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def compress_response(response):
+    if not compressible(response) or response.direct_passthrough:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate()
+    if not encoding:
+        return response
+    if response.is_streamed:
+        level = current_app.config['COMPRESS_BR_LEVEL' if encoding == 'br' else 'COMPRESS_LEVEL']
+        response.response = stream_compress(response.iter_encoded(), encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# --------------------------------------------------------------------------------------------------
+# Pre-compressed representations
+# The body of a response is kept once per content encoding under a caller supplied key, the key
+# must change whenever the underlying data does
+# --------------------------------------------------------------------------------------------------
+def representation_response(entry, encoding):
+    response = Response(entry['bodies'][encoding], status=entry['status'], mimetype=entry['mimetype'])
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    if entry['mimetype'] in current_app.config['COMPRESS_MIMETYPES']:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def encoded_representation(key, entry):
+    """Return the representation in the negotiated encoding, compressing it on first use
+    """
+    encoding = 'identity'
+    identity = entry['bodies']['identity']
+    if (entry['mimetype'] in current_app.config['COMPRESS_MIMETYPES']
+            and len(identity) >= current_app.config['COMPRESS_MIN_SIZE']):
+        encoding = negotiate() or 'identity'
+    if encoding not in entry['bodies']:
+        entry['bodies'][encoding] = compress(identity, encoding)
+        current_app.extensions['representations'].set(key, entry)
+    return representation_response(entry, encoding)
+
+
+def cached_representation(key):
+    entry = current_app.extensions['representations'].get(key)
+    if entry is None:
+        return None
+    return encoded_representation(key, entry)
+
+
+def store_representation(key, response):
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+        return response
+    entry = {'status': response.status_code, 'mimetype': response.mimetype,
+             'bodies': {'identity': response.get_data()}}
+    current_app.extensions['representations'].set(key, entry)
+    return encoded_representation(key, entry)
@@ -0,0 +1,43 @@
+import os
+from sqlalchemy.pool import QueuePool
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --------------------------------------------------------------------------------------------------
+# Default configuration, every value can be overridden from the environment or by the mapping
+# given to create_app(). Kept free of the api's heavy imports so gunicorn's master can read it
+# --------------------------------------------------------------------------------------------------
+class Config:
+    # only SQLite is supported, the default is absolute so every Flask-SQLAlchemy version and a
+    # bare engine resolve it to the same file
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(BASE_DIR, 'z3457800.db'))
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': QueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        # seconds a worker waits on another worker's write lock before giving up
+        'connect_args': {'timeout': int(os.environ.get('DB_BUSY_TIMEOUT', 15)),
+                         'check_same_thread': False},
+    }
+    # responses smaller than COMPRESS_MIN_SIZE bytes are sent as they are
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL', 4))
+    # rendered list pages and statistics, kept pre-compressed per process
+    REPRESENTATION_CACHE_SIZE = int(os.environ.get('REPRESENTATION_CACHE_SIZE', 256))
+    REPRESENTATION_CACHE_TTL = int(os.environ.get('REPRESENTATION_CACHE_TTL', 60))
+    # assembled GET /actors/<id> payloads, "memory" caches per process, "shared" in a local SQLite
+    # file used by every worker, "none" switches the cache off. With "memory" a write is only
+    # invalidated in the worker that handled it, so gunicorn.conf.py defaults to "shared" when it
+    # runs several workers and warm_up() refuses "memory" there
+    ACTOR_CACHE_BACKEND = os.environ.get('ACTOR_CACHE_BACKEND', 'memory')
+    ACTOR_CACHE_PATH = os.environ.get('ACTOR_CACHE_PATH', os.path.join(BASE_DIR, 'actor_cache.db'))
+    ACTOR_CACHE_SIZE = int(os.environ.get('ACTOR_CACHE_SIZE', 10000))
+    ACTOR_CACHE_TTL = int(os.environ.get('ACTOR_CACHE_TTL', 300))
+    # the most recently updated actors are loaded into the cache by warm_up(), 0 skips it
+    ACTOR_CACHE_PRIME = int(os.environ.get('ACTOR_CACHE_PRIME', 100))
+    # requests sending this token in X-Profile or ?_profile= are profiled, unset disables profiling
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
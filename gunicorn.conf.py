@@ -0,0 +1,33 @@
+import multiprocessing
+import os
+
+# --------------------------------------------------------------------------------------------------
+# Gunicorn settings for serving the actors api with one process per core
+# Run with: gunicorn -c gunicorn.conf.py
+# --------------------------------------------------------------------------------------------------
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 1))
+# each worker imports wsgi.py itself, so no engine or connection is shared across a fork
+preload_app = False
+
+# several workers need the shared actor cache, see ACTOR_CACHE_BACKEND in config.py
+if workers > 1:
+    os.environ.setdefault('ACTOR_CACHE_BACKEND', 'shared')
+
+
+def on_starting(server):
+    # migrate once in the master before any worker exists, through a bare engine so the master
+    # does not import the api itself
+    from sqlalchemy import create_engine
+    from config import Config
+    from migrations import upgrade
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+    upgrade(engine)
+    engine.dispose()
+
+
+def post_worker_init(worker):
+    from z3457800 import warm_up
+    warm_up(worker.wsgi, worker.cfg.workers)
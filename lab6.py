@@ -1,4 +1,5 @@
 import json
+from bisect import bisect_left, bisect_right, insort
 
 import pandas as pd
 from flask import Flask
@@ -28,13 +29,129 @@ book_model = api.model('Book', {
 parser = reqparse.RequestParser()
 parser.add_argument('order', choices=list(column for column in book_model.keys()))
 parser.add_argument('ascending', type=inputs.boolean)
+parser.add_argument('Publisher', help='Only return books from this publisher')
+parser.add_argument('Author', help='Only return books by this author')
+parser.add_argument('Place_of_Publication', help='Only return books published at this place')
+parser.add_argument('place_match', choices=('exact', 'prefix'), default='exact',
+                    help='How Place_of_Publication is matched (Default: exact)')
+parser.add_argument('year_from', type=int, help='Earliest Date_of_Publication (inclusive)')
+parser.add_argument('year_to', type=int, help='Latest Date_of_Publication (inclusive)')
+
+
+class BookIndex:
+    """Secondary indexes over the books dataframe, keyed by Identifier.
+
+    Categorical columns use hash indexes (value -> set of ids), the place of
+    publication additionally keeps a sorted (place, id) array for prefix
+    matching, and the year is kept as a sorted (year, id) array for range
+    lookups. Every lookup costs O(log n + k) for a result of size k.
+    """
+    hash_columns = ('Publisher', 'Author', 'Place_of_Publication')
+
+    def __init__(self):
+        self.hashes = {column: {} for column in self.hash_columns}
+        self.places = []
+        self.years = []
+
+    def build(self, frame):
+        self.__init__()
+        for id, row in frame.iterrows():
+            self.add(id, row, keep_sorted=False)
+        # one sort is O(n log n), inserting every row in order would be O(n^2)
+        self.places.sort()
+        self.years.sort()
+
+    def add(self, id, book, keep_sorted=True):
+        for column in self.hash_columns:
+            value = book.get(column)
+            if isinstance(value, str):
+                self.hashes[column].setdefault(value, set()).add(id)
+        place = book.get('Place_of_Publication')
+        if isinstance(place, str):
+            self._insert(self.places, (place, id), keep_sorted)
+        year = self._year(book)
+        if year is not None:
+            self._insert(self.years, (year, id), keep_sorted)
+
+    def remove(self, id, book):
+        for column in self.hash_columns:
+            value = book.get(column)
+            ids = self.hashes[column].get(value)
+            if ids is not None:
+                ids.discard(id)
+                if not ids:
+                    del self.hashes[column][value]
+        place = book.get('Place_of_Publication')
+        if isinstance(place, str):
+            self._discard(self.places, (place, id))
+        year = self._year(book)
+        if year is not None:
+            self._discard(self.years, (year, id))
+
+    @staticmethod
+    def _year(book):
+        # the loader fills unknown publication dates with 0, those books have no year to index
+        year = book.get('Date_of_Publication')
+        if year is None or pd.isna(year) or int(year) == 0:
+            return None
+        return int(year)
+
+    @staticmethod
+    def _insert(array, entry, keep_sorted):
+        if keep_sorted:
+            insort(array, entry)
+        else:
+            array.append(entry)
+
+    @staticmethod
+    def _discard(array, entry):
+        pos = bisect_left(array, entry)
+        if pos < len(array) and array[pos] == entry:
+            del array[pos]
+
+    def place_prefix(self, prefix):
+        lo = bisect_left(self.places, (prefix,))
+        hi = bisect_left(self.places, (prefix + '\U0010ffff',))
+        return {id for _, id in self.places[lo:hi]}
+
+    def year_range(self, year_from=None, year_to=None):
+        lo = 0 if year_from is None else bisect_left(self.years, (year_from,))
+        hi = len(self.years) if year_to is None else bisect_right(self.years, (year_to, float('inf')))
+        return {id for _, id in self.years[lo:hi]}
+
+    def lookup(self, args):
+        """Return the ids matching the filters in args, or None when no filter is given."""
+        candidates = []
+        for column in ('Publisher', 'Author'):
+            if args.get(column) is not None:
+                candidates.append(self.hashes[column].get(args[column], set()))
+        place = args.get('Place_of_Publication')
+        if place is not None:
+            if args.get('place_match') == 'prefix':
+                candidates.append(self.place_prefix(place))
+            else:
+                candidates.append(self.hashes['Place_of_Publication'].get(place, set()))
+        if args.get('year_from') is not None or args.get('year_to') is not None:
+            candidates.append(self.year_range(args.get('year_from'), args.get('year_to')))
+        if not candidates:
+            return None
+        # intersect starting from the smallest candidate set
+        candidates.sort(key=len)
+        ids = set(candidates[0])
+        for other in candidates[1:]:
+            ids &= other
+        return ids
+
+
+book_index = BookIndex()
 
 
 @api.route('/books')
 class BooksList(Resource):
 
     @api.response(200, 'Successful')
-    @api.doc(description="Get all books")
+    @api.doc(description="Get all books, optionally filtered by publisher, author, place or year range")
+    @api.expect(parser)
     def get(self):
         # get books as JSON string
         args = parser.parse_args()
@@ -43,10 +160,18 @@ class BooksList(Resource):
         order_by = args.get('order')
         ascending = args.get('ascending', True)
 
-        if order_by:
-            df.sort_values(by=order_by, inplace=True, ascending=ascending)
+        # resolve the filters through the secondary indexes so only matching rows are touched
+        ids = book_index.lookup(args)
+        if ids is None:
+            books = df
+            if order_by:
+                df.sort_values(by=order_by, inplace=True, ascending=ascending)
+        else:
+            books = df.loc[sorted(ids)]
+            if order_by:
+                books = books.sort_values(by=order_by, ascending=ascending)
 
-        json_str = df.to_json(orient='index')
+        json_str = books.to_json(orient='index')
 
         # convert the string JSON to a real JSON
         ds = json.loads(json_str)
@@ -80,7 +205,9 @@ class BooksList(Resource):
             if key not in book_model.keys():
                 # unexpected column
                 return {"message": "Property {} is invalid".format(key)}, 400
+        for key in book:
             df.loc[id, key] = book[key]
+        book_index.add(id, dict(df.loc[id]))
 
         # df.append(book, ignore_index=True)
         return {"message": "Book {} is created".format(id)}, 201
@@ -106,6 +233,7 @@ class Books(Resource):
         if id not in df.index:
             api.abort(404, "Book {} doesn't exist".format(id))
 
+        book_index.remove(id, dict(df.loc[id]))
         df.drop(id, inplace=True)
         return {"message": "Book {} is removed.".format(id)}, 200
 
@@ -131,13 +259,15 @@ class Books(Resource):
             if key not in book_model.keys():
                 # unexpected column
                 return {"message": "Property {} is invalid".format(key)}, 400
+        book_index.remove(id, dict(df.loc[id]))
+        for key in book:
             df.loc[id, key] = book[key]
+        book_index.add(id, dict(df.loc[id]))
 
-        df.append(book, ignore_index=True)
         return {"message": "Book {} has been successfully updated".format(id)}, 200
 
 
-if __name__ == '__main__':
+def load_books(csv_file):
     columns_to_drop = ['Edition Statement',
                        'Corporate Author',
                        'Corporate Contributors',
@@ -147,7 +277,6 @@ if __name__ == '__main__':
                        'Issuance type',
                        'Shelfmarks'
                        ]
-    csv_file = "Books.csv"
     df = pd.read_csv(csv_file)
 
     # drop unnecessary columns
@@ -164,6 +293,14 @@ if __name__ == '__main__':
 
     # set the index column; this will help us to find books with their ids
     df.set_index('Identifier', inplace=True)
+    return df
+
+
+if __name__ == '__main__':
+    df = load_books("Books.csv")
+
+    # build the secondary indexes used by the filtered GET /books
+    book_index.build(df)
 
     # run the application
     app.run(debug=True)
\ No newline at end of file
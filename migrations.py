@@ -0,0 +1,71 @@
+from sqlalchemy import text
+
+# --------------------------------------------------------------------------------------------------
+# Versioned schema migrations for the actors database
+# The version applied to a database is kept in SQLite's PRAGMA user_version, every migration is
+# written with IF [NOT] EXISTS so databases created by the old db.create_all() upgrade cleanly
+# --------------------------------------------------------------------------------------------------
+MIGRATIONS = [
+    (1, 'Create the actors_info table', [
+        'CREATE TABLE IF NOT EXISTS actors_info (\n'
+        '    id INTEGER NOT NULL,\n'
+        '    tvmaze_id INTEGER,\n'
+        '    name VARCHAR,\n'
+        '    country VARCHAR,\n'
+        '    birthday DATETIME,\n'
+        '    deathday DATETIME,\n'
+        '    gender VARCHAR,\n'
+        '    last_update DATETIME,\n'
+        '    shows VARCHAR,\n'
+        '    PRIMARY KEY (id),\n'
+        '    UNIQUE (tvmaze_id)\n'
+        ')',
+    ]),
+    (2, 'Index the columns GET /actors orders by', [
+        # id is the rowid alias, an extra index on it is never used
+        'DROP INDEX IF EXISTS ix_actors_info_id',
+        'CREATE INDEX IF NOT EXISTS ix_actors_info_name ON actors_info (name)',
+        'CREATE INDEX IF NOT EXISTS ix_actors_info_deathday ON actors_info (deathday)',
+        'CREATE INDEX IF NOT EXISTS ix_actors_info_last_update ON actors_info (last_update)',
+        # shows is left unindexed, it holds the whole credit list and an index would copy the
+        # largest column of the table for a rarely used sort
+        # the composite indexes also serve "order=country" and "order=birthday" on their own
+        'CREATE INDEX IF NOT EXISTS ix_actors_info_country_name ON actors_info (country, name)',
+        'CREATE INDEX IF NOT EXISTS ix_actors_info_birthday_name ON actors_info (birthday, name)',
+    ]),
+    (3, 'Add the data version counter', [
+        # a single row bumped by every write, cached representations are keyed on it
+        'CREATE TABLE IF NOT EXISTS data_version (\n'
+        '    id INTEGER NOT NULL CHECK (id = 1),\n'
+        '    generation INTEGER NOT NULL,\n'
+        '    PRIMARY KEY (id)\n'
+        ')',
+        'INSERT OR IGNORE INTO data_version (id, generation) VALUES (1, 0)',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute(text('PRAGMA user_version')).scalar()
+
+
+def upgrade(engine):
+    """Apply every migration newer than the database version, return the list of applied versions
+    """
+    applied = []
+    with engine.begin() as conn:
+        version = current_version(conn)
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(text(f'PRAGMA user_version = {number}'))
+            applied.append(number)
+    with engine.connect() as conn:
+        # WAL lets the readers in every worker run alongside a single writer, the mode is stored
+        # in the database file and cannot be changed inside a transaction
+        conn.execute(text('PRAGMA journal_mode=WAL'))
+    return applied
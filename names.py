@@ -0,0 +1,91 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from urllib.parse import quote
+
+# --------------------------------------------------------------------------------------------------
+# Actor name normalization and matching against TVmaze search/people results
+# Names are case and accent folded ("Zoë" -> "zoe") before comparing, letters of every script are kept
+# --------------------------------------------------------------------------------------------------
+SEARCH_URL = 'https://api.tvmaze.com/search/people?q={}'
+
+# a candidate matched on spelling alone needs at least this similarity ratio
+MATCH_THRESHOLD = 0.9
+# a candidate with one extra middle name still needs this similarity ratio
+SUBSET_THRESHOLD = 0.7
+
+# tokens that name a different person of the same name, never a left out middle name
+SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv'}
+
+# how a candidate matched, any token based match ranks above every fuzzy one
+FUZZY, SUBSET, REORDERED, EXACT = 0, 1, 2, 3
+
+# runs of anything but letters and digits, in any script
+SEPARATORS = re.compile(r'[\W_]+')
+
+# letters NFKD does not decompose into a base letter and a combining mark
+EXTRA_FOLDS = str.maketrans({'ø': 'o', 'æ': 'ae', 'œ': 'oe', 'ł': 'l', 'đ': 'd', 'ð': 'd',
+                             'þ': 'th', 'ı': 'i'})
+
+
+def fold(name):
+    decomposed = unicodedata.normalize('NFKD', name.casefold())
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.translate(EXTRA_FOLDS)
+
+
+def normalize_name(name):
+    """Folded name with every run of other characters replaced by a single space,
+    eg: "  Zoë  Saldaña-Perego" -> "zoe saldana perego", "Владимир  Путин" -> "владимир путин"
+    """
+    return SEPARATORS.sub(' ', fold(name)).strip()
+
+
+def search_url(name):
+    """URL of the TVmaze people search for a user supplied name, punctuation becomes spaces
+    """
+    return SEARCH_URL.format(quote(SEPARATORS.sub(' ', name).strip()))
+
+
+def match_score(normalized, tokens, candidate):
+    """Score a candidate name against an already normalized input as (tier, similarity ratio),
+    the ratio orders candidates within a tier
+    """
+    other = normalize_name(candidate)
+    ratio = SequenceMatcher(None, normalized, other).ratio()
+    if other.replace(' ', '') == normalized.replace(' ', ''):
+        return EXACT, ratio
+    other_tokens = other.split()
+    if sorted(other_tokens) == sorted(tokens):
+        # same names in another order, eg: "Pitt Brad"
+        return REORDERED, ratio
+    if len(tokens) > 1 and len(other_tokens) == len(tokens) + 1 and ratio >= SUBSET_THRESHOLD:
+        # one middle name or initial left out, eg: "Samuel Jackson" for "Samuel L. Jackson"
+        for i in range(1, len(tokens)):
+            if (other_tokens[:i] + other_tokens[i + 1:] == tokens
+                    and other_tokens[i] not in SUFFIXES):
+                return SUBSET, ratio
+    return FUZZY, ratio
+
+
+def best_match(name, results, threshold=MATCH_THRESHOLD):
+    """Return the person of the best scoring search result, or None when nothing matches.
+    All results are scored in one pass, ties go to the result TVmaze ranked higher
+    """
+    normalized = normalize_name(name)
+    # TVmaze answers errors with a dict
+    if not normalized or not isinstance(results, list):
+        return None
+    tokens = normalized.split()
+    best, best_score = None, None
+    for result in results:
+        person = result.get('person') or {}
+        if not person.get('name'):
+            continue
+        score = match_score(normalized, tokens, person['name'])
+        if score[0] == FUZZY and score[1] < threshold:
+            continue
+        # strictly greater keeps the earlier, higher ranked result on a tie
+        if best_score is None or score > best_score:
+            best, best_score = person, score
+    return best
@@ -0,0 +1,122 @@
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import time
+import uuid
+from threading import Lock
+from urllib.parse import urlencode
+from flask import current_app, g, request
+from config import BASE_DIR
+from sqlalchemy import event
+
+# --------------------------------------------------------------------------------------------------
+# Opt-in per-request profiling
+# A request carrying the PROFILE_TOKEN in the X-Profile header or the _profile query argument runs
+# under cProfile with every SQL statement timed. The report is written to PROFILE_DIR and its id is
+# returned in the X-Profile-Id header. Nothing is registered while PROFILE_TOKEN is unset, and the
+# SQL listeners are only attached while a profiled request is running
+# --------------------------------------------------------------------------------------------------
+def init_profiling(app, db):
+    app.config.setdefault('PROFILE_TOKEN', None)
+    app.config.setdefault('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+    app.config.setdefault('PROFILE_SORT', 'cumulative')
+    app.config.setdefault('PROFILE_LIMIT', 40)
+    if not app.config['PROFILE_TOKEN']:
+        return
+    app.extensions['profiling'] = {'db': db, 'active': 0, 'lock': Lock()}
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(stop_profile)
+
+
+def profiling():
+    return g.get('profile') is not None
+
+
+def requested():
+    token = request.headers.get('X-Profile') or request.args.get('_profile')
+    # compared as bytes, compare_digest rejects non-ASCII str
+    return bool(token) and hmac.compare_digest(token.encode(), current_app.config['PROFILE_TOKEN'].encode())
+
+
+def recorded_url():
+    # the _profile argument carries the token, keep it out of the stored report
+    query = urlencode([(key, value) for key, value in request.args.items(multi=True) if key != '_profile'])
+    return f'{request.path}?{query}' if query else request.path
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if g.get('profile') is not None:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if g.get('profile') is not None and conn.info.get('profile_started'):
+        elapsed = time.perf_counter() - conn.info['profile_started'].pop()
+        g.profile['queries'].append({'statement': statement, 'parameters': repr(parameters)[:500],
+                                     'ms': round(elapsed * 1000, 3)})
+
+
+def attach_listeners(state):
+    engine = state['db'].engine
+    with state['lock']:
+        if not state['active']:
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        state['active'] += 1
+
+
+def detach_listeners(state):
+    engine = state['db'].engine
+    with state['lock']:
+        state['active'] -= 1
+        if not state['active']:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+            event.remove(engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def start_profile():
+    if not requested():
+        return
+    attach_listeners(current_app.extensions['profiling'])
+    g.profile = {'queries': [], 'profiler': cProfile.Profile(), 'started': time.perf_counter()}
+    g.profile['profiler'].enable()
+
+
+def stop_profile(exc=None):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return None
+    profile['profiler'].disable()
+    detach_listeners(current_app.extensions['profiling'])
+    return profile
+
+
+def finish_profile(response):
+    profile = stop_profile()
+    if profile is None:
+        return response
+    elapsed = time.perf_counter() - profile['started']
+    profile_id = uuid.uuid4().hex
+    stats_text = io.StringIO()
+    stats = pstats.Stats(profile['profiler'], stream=stats_text)
+    stats.sort_stats(current_app.config['PROFILE_SORT']).print_stats(current_app.config['PROFILE_LIMIT'])
+    sql_ms = round(sum(query['ms'] for query in profile['queries']), 3)
+    report = {'id': profile_id, 'method': request.method, 'url': recorded_url(),
+              'status': response.status_code, 'ms': round(elapsed * 1000, 3),
+              'sql-count': len(profile['queries']), 'sql-ms': sql_ms,
+              'queries': profile['queries'], 'profile': stats_text.getvalue()}
+    directory = current_app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    # the .prof file opens in pstats, snakeviz and similar tools
+    stats.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+    with open(os.path.join(directory, f'{profile_id}.json'), 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    response.headers['X-Profile-Id'] = profile_id
+    response.headers['X-Profile-Time-Ms'] = str(report['ms'])
+    response.headers['X-Profile-SQL-Count'] = str(report['sql-count'])
+    response.headers['X-Profile-SQL-Ms'] = str(sql_ms)
+    return response
@@ -0,0 +1,128 @@
+import multiprocessing
+from datetime import datetime
+import pytest
+import z3457800
+from cache import MemoryCache, SharedCache
+from migrations import upgrade
+from z3457800 import ActorsInfo, actor_key, commit_changes, create_app, db, warm_up
+
+
+@pytest.fixture(params=['memory', 'shared'])
+def app(request, tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'actors.db'}",
+                      'ACTOR_CACHE_BACKEND': request.param,
+                      'ACTOR_CACHE_PATH': str(tmp_path / 'actor_cache.db')})
+    with app.app_context():
+        upgrade(db.engine)
+        db.session.add_all([ActorsInfo(name=name, country=country) for name, country in
+                            [('Ann Lee', 'Australia'), ('Bob Ray', 'Canada'), ('Cal Oak', 'Canada')]])
+        commit_changes()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def links(client, id):
+    response = client.get(f'/actors/{id}')
+    assert response.status_code == 200
+    return {name: int(link['href'].rsplit('/', 1)[1]) for name, link in response.json['_links'].items()
+            if name != 'self'}
+
+
+def test_post_invalidates_the_previous_actor(client, monkeypatch):
+    person = {'id': 7, 'name': 'Dee Elm', 'birthday': None, 'deathday': None, 'country': None,
+              'gender': 'Female'}
+    monkeypatch.setattr(z3457800, 'request_data',
+                        lambda url: [{'person': person}] if 'search' in url else None)
+    assert links(client, 3) == {'previous': 2}
+    response = client.post('/actors?name=Dee Elm')
+    assert response.status_code == 201
+    assert links(client, 3) == {'previous': 2, 'next': response.json['id']}
+
+
+def test_delete_invalidates_both_neighbours(client):
+    assert links(client, 1) == {'next': 2}
+    assert links(client, 3) == {'previous': 2}
+    assert client.delete('/actors/2').status_code == 200
+    assert links(client, 1) == {'next': 3}
+    assert links(client, 3) == {'previous': 1}
+
+
+def test_bulk_patch_invalidates_the_updated_actors(client):
+    for id in [1, 2, 3]:
+        client.get(f'/actors/{id}')
+    response = client.patch('/actors/bulk', json={'filter': {'country': 'Canada'},
+                                                  'changes': {'country': 'Kanada'}})
+    assert response.json['count'] == 2
+    assert [client.get(f'/actors/{id}').json['country'] for id in [1, 2, 3]] == ['Australia', 'Kanada', 'Kanada']
+
+
+def test_bulk_delete_invalidates_the_remaining_actors(client):
+    assert links(client, 1) == {'next': 2}
+    response = client.delete('/actors/bulk', json={'ids': [2, 3]})
+    assert response.json['count'] == 2
+    assert links(client, 1) == {}
+    assert client.get('/actors/2').status_code == 404
+
+
+def test_warm_up_loads_the_most_recently_updated_actors(app):
+    app.config['ACTOR_CACHE_PRIME'] = 2
+    with app.app_context():
+        db.session.get(ActorsInfo, 2).last_update = datetime(2000, 1, 1)
+        commit_changes()
+    warm_up(app)
+    cache = app.extensions['actor_cache']
+    assert [cache.get(actor_key(id)) is not None for id in [1, 2, 3]] == [True, False, True]
+
+
+@pytest.fixture(params=['memory', 'shared'])
+def cache(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryCache()
+    return SharedCache(str(tmp_path / 'cache.db'))
+
+
+@pytest.mark.parametrize('invalidate', ['delete', 'clear'])
+def test_set_after_an_invalidation_is_dropped(cache, invalidate):
+    generation = cache.generation('actor:1')
+    if invalidate == 'delete':
+        cache.delete('actor:1')
+    else:
+        cache.clear()
+    cache.set('actor:1', 'stale', generation)
+    assert cache.get('actor:1') is None
+    cache.set('actor:1', 'fresh', cache.generation('actor:1'))
+    assert cache.get('actor:1') == 'fresh'
+
+
+def shared_set(path, key, value):
+    SharedCache(path).set(key, value)
+
+
+def shared_delete(path, key):
+    SharedCache(path).delete(key)
+
+
+def run_in_process(target, *args):
+    process = multiprocessing.Process(target=target, args=args)
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+
+def test_shared_cache_across_processes(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = SharedCache(path)
+    run_in_process(shared_set, path, 'actor:1', 'from another worker')
+    assert cache.get('actor:1') == 'from another worker'
+
+    generation = cache.generation('actor:1')
+    run_in_process(shared_delete, path, 'actor:1')
+    assert cache.get('actor:1') is None
+    cache.set('actor:1', 'stale', generation)
+    assert cache.get('actor:1') is None
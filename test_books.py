@@ -0,0 +1,75 @@
+import os
+import pytest
+import lab6
+from lab6 import BookIndex, load_books
+
+BOOKS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Books.csv')
+
+
+@pytest.fixture
+def client():
+    lab6.df = load_books(BOOKS_CSV)
+    lab6.book_index.build(lab6.df)
+    return lab6.app.test_client()
+
+
+def ids(response):
+    assert response.status_code == 200
+    return sorted(book['Identifier'] for book in response.json)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('Place_of_Publication=Paris', [2956, 2957]),
+    ('Place_of_Publication=London]', [874]),
+    ('Place_of_Publication=Puerto&place_match=prefix', [667, 3017]),
+    ('Place_of_Publication=London&place_match=prefix', [206, 216, 218, 472, 480, 481, 519, 874, 1143, 2854]),
+    ('Place_of_Publication=Londo&place_match=exact', []),
+    ('Place_of_Publication=Z&place_match=prefix', []),
+    ('Author=A., E. S.', [472, 480, 481]),
+    ('Publisher=W. Abbatt', [3131]),
+    ('Author=A., E. S.&year_from=1852', [480, 481]),
+    ('year_from=1888&year_to=1888', [1905, 2836, 2854]),
+    ('year_to=1700', [874, 1143, 1929]),
+    ('year_from=1899', [3131]),
+    ('year_to=0', []),
+])
+def test_filters(client, query, expected):
+    assert ids(client.get(f'/books?{query}')) == expected
+
+
+def test_post_put_delete_keep_indexes_in_sync(client):
+    book = {'Identifier': 1, 'Publisher': 'New House', 'Place_of_Publication': 'Londinium',
+            'Date_of_Publication': 1700}
+    assert client.post('/books', json=book).status_code == 201
+    assert ids(client.get('/books?Place_of_Publication=Lond&place_match=prefix&year_to=1700')) == [1, 874, 1143]
+    assert ids(client.get('/books?Publisher=New House')) == [1]
+
+    assert client.put('/books/1', json={'Publisher': 'Old House', 'Date_of_Publication': 1950}).status_code == 200
+    assert ids(client.get('/books?Publisher=New House')) == []
+    assert ids(client.get('/books?Publisher=Old House&year_from=1950')) == [1]
+    assert ids(client.get('/books?year_to=1700')) == [874, 1143, 1929]
+
+    assert client.delete('/books/1').status_code == 200
+    assert ids(client.get('/books?Publisher=Old House')) == []
+    assert ids(client.get('/books?Place_of_Publication=Londinium')) == []
+
+
+def test_unknown_dates_are_not_indexed():
+    index = BookIndex()
+    index.add(1, {'Date_of_Publication': 0})
+    index.add(2, {'Date_of_Publication': float('nan')})
+    index.add(3, {'Date_of_Publication': 1850})
+    assert index.years == [(1850, 3)]
+    index.remove(1, {'Date_of_Publication': 0})
+    assert index.year_range(None, 1900) == {3}
+
+
+def test_build_matches_incremental_adds():
+    frame = load_books(BOOKS_CSV)
+    built, added = BookIndex(), BookIndex()
+    built.build(frame)
+    for id, row in frame.iterrows():
+        added.add(id, row)
+    assert built.places == added.places
+    assert built.years == added.years
+    assert built.hashes == added.hashes
@@ -0,0 +1,61 @@
+import pytest
+from names import EXACT, FUZZY, REORDERED, SUBSET, best_match, match_score, normalize_name
+
+
+def results(*names):
+    return [{'score': 1 - i / 10, 'person': {'id': i, 'name': name}} for i, name in enumerate(names)]
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('  Zoë  Saldaña-Perego', 'zoe saldana perego'),
+    ('Søren Kierkegaard', 'soren kierkegaard'),
+    ('Владимир Путин', 'владимир путин'),
+    ('宮崎 駿', '宮崎 駿'),
+    ('!?', ''),
+])
+def test_normalize_name(name, expected):
+    assert normalize_name(name) == expected
+
+
+@pytest.mark.parametrize('name, candidate, tier', [
+    ('Brad Pitt', 'brad  PITT', EXACT),
+    ('Zoe Saldana', 'Zoë Saldaña', EXACT),
+    ('Pitt, Brad', 'Brad Pitt', REORDERED),
+    ('Samuel Jackson', 'Samuel L. Jackson', SUBSET),
+    ('Sarah Parker', 'Sarah Jessica Parker', SUBSET),
+    ('John Smith', 'John Smith Jr', FUZZY),
+    ('John Smith', 'John Jr Smith', FUZZY),
+    ('Mary Ann', 'Mary Ann Evans Cross Eliot', FUZZY),
+    ('Michael Jordan', 'Michael B. Jordan', SUBSET),
+    ('John Smith', 'Jon Smith', FUZZY),
+    ('Владимир Путин', 'Анна Каренина', FUZZY),
+])
+def test_match_score_tier(name, candidate, tier):
+    normalized = normalize_name(name)
+    assert match_score(normalized, normalized.split(), candidate)[0] == tier
+
+
+@pytest.mark.parametrize('name, candidates, expected', [
+    ('John Smith', ['Jon Smith', 'John Smith Jr'], 'Jon Smith'),
+    ('John Smith', ['John Smith Jr'], None),
+    ('Mary Ann', ['Mary Ann Evans Cross Eliot'], None),
+    ('Michael Jordan', ['Michael B. Jordan', 'Michael Jordan'], 'Michael Jordan'),
+    ('Penelope Cruz', ['Penélope Cruz Sánchez', 'Penelope Cruz'], 'Penelope Cruz'),
+    ('Brad Pit', ['Brad Pitt', 'Brad Pitts'], 'Brad Pitt'),
+    ('Владимир Путин', ['Анна Каренина', 'Владимир Путин'], 'Владимир Путин'),
+    ('Владимир Путин', ['Анна Каренина'], None),
+    ('John Smith', ['Jane Doe'], None),
+    ('!?', ['Anyone'], None),
+])
+def test_best_match(name, candidates, expected):
+    person = best_match(name, results(*candidates))
+    assert (person and person['name']) == expected
+
+
+@pytest.mark.parametrize('response', [
+    None,
+    {'name': 'Not Found', 'message': 'Page not found.', 'status': 404},
+    'Brad Pitt',
+])
+def test_best_match_ignores_error_responses(response):
+    assert best_match('Brad Pitt', response) is None
@@ -0,0 +1,6 @@
+from z3457800 import create_app
+
+# --------------------------------------------------------------------------------------------------
+# WSGI entry point, eg: gunicorn -c gunicorn.conf.py wsgi:app
+# --------------------------------------------------------------------------------------------------
+app = create_app()
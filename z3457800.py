@@ -1,6 +1,9 @@
 import json
+import click
 from datetime import datetime
-from flask import Flask, request, send_file
+from functools import wraps
+from flask import Flask, Response, current_app, request
+from flask.cli import with_appcontext
 from flask_restx import Resource, Api, fields, reqparse
 from flask_sqlalchemy import SQLAlchemy
 import requests
@@ -8,16 +11,19 @@ import re
 import pandas as pd
 import matplotlib.pyplot as plt
 from io import BytesIO
+from sqlalchemy.engine import make_url
+from config import Config
+from migrations import LATEST_VERSION, current_version, upgrade
+from compression import init_compression, cached_representation, store_representation
+from cache import make_cache
+from profiling import init_profiling, profiling
+from names import best_match, search_url
 
 # --------------------------------------------------------------------------------------------------
-# Initialise the flask framework
-# Create a new db with sqlAlchemy track notification disabled
+# Create the extensions unbound, create_app() attaches them to an application
 # --------------------------------------------------------------------------------------------------
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///z3457800.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-api = Api(app, title='Assignemnt2', default ='Api list for questions', default_label='')
-db = SQLAlchemy(app)
+api = Api(title='Assignemnt2', default ='Api list for questions', default_label='')
+db = SQLAlchemy()
 
 # --------------------------------------------------------------------------------------------------
 # Create the arguments for each api
@@ -40,6 +46,23 @@ q5_param.add_argument('page', type=int, help="Which page to display,\neg: 1 (Def
 q5_param.add_argument('size', type=int, help="Shows the number of actors per page,\neg: 10 (Default: 10)")
 q5_param.add_argument('filter', type=str, help="Shows what attribute should be shown for each actor,\neg: id,name (Default: id, name)")
 
+q7_filter = api.model('Bulk filter', {
+    "name": fields.String(example="Jones Smith"),
+    "country": fields.String(example="America"),
+    "gender": fields.String(example="Female")
+})
+
+q7_update = api.model('Bulk update', {
+    "ids": fields.List(fields.Integer, example=[1, 2, 3]),
+    "filter": fields.Nested(q7_filter),
+    "changes": fields.Nested(q4_payload, required=True)
+})
+
+q7_delete = api.model('Bulk delete', {
+    "ids": fields.List(fields.Integer, example=[1, 2, 3]),
+    "filter": fields.Nested(q7_filter)
+})
+
 q6_param = reqparse.RequestParser()
 q6_param.add_argument('format', type=str,
                       help='The expected output format, can be either "json" or "image"\neg: json', required=True)
@@ -54,7 +77,7 @@ q6_param.add_argument('by', type=str,
 # --------------------------------------------------------------------------------------------------
 class ActorsInfo(db.Model):
     __tablename__ = 'actors_info'
-    id = db.Column(db.Integer, autoincrement=True, primary_key=True, index=True)
+    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
     tvmaze_id = db.Column(db.Integer, unique=True)
     name = db.Column(db.String())
     country = db.Column(db.String())
@@ -64,6 +87,15 @@ class ActorsInfo(db.Model):
     last_update = db.Column(db.DateTime(), default=datetime.now())
     shows = db.Column(db.String())
 
+# --------------------------------------------------------------------------------------------------
+# Columns accepted by the order and filter inputs of Q5, all but shows are indexed (migrations.py)
+# --------------------------------------------------------------------------------------------------
+db_finder = {'id': ActorsInfo.id, 'name': ActorsInfo.name,
+             'country': ActorsInfo.country, 'birthday': ActorsInfo.birthday,
+             'deathday': ActorsInfo.deathday, 'last-update': ActorsInfo.last_update,
+             'last_update': ActorsInfo.last_update, 'shows': ActorsInfo.shows}
+order_map = {'+': 'asc', '-': 'desc'}
+
 
 # --------------------------------------------------------------------------------------------------
 # Utility functions
@@ -82,13 +114,6 @@ def request_data(url):
         data = None
     return data
 
-def check_vaild_name(input_name ,name_list):
-    if not len(name_list):
-        return False
-    first_name = ''.join(re.findall('[A-Za-z0-9]', name_list[0]['person']['name'])).lower()
-    input_name = ''.join(re.findall('[A-Za-z0-9]', input_name)).lower()
-    return first_name == input_name
-
 def get_show_list(id):
     show_pack = request_data(f'https://api.tvmaze.com/people/{id}/castcredits?embed=show')
     if not show_pack: return None
@@ -107,26 +132,63 @@ def str_to_time(str):
     if not str: return None
     return datetime.strptime(str, "%Y-%m-%d")
 
-def create_response(actor):
+def neighbour_ids(id):
+    prev_id = db.session.query(db.func.max(ActorsInfo.id)).filter(ActorsInfo.id < id).scalar()
+    next_id = db.session.query(db.func.min(ActorsInfo.id)).filter(ActorsInfo.id > id).scalar()
+    return prev_id, next_id
+
+def actor_entry(actor):
+    """The cacheable part of Q2's response, links are stored as ids since they depend on the host
+    """
     show_list = None
     if actor.shows:
         show_list = actor.shows.split('@%')
-    host, port = host_port()
-    links = {'self':{'href': f"http://{host}:{port}/actors/{actor.id}"}}
-    next_link = ActorsInfo.query.order_by('id').filter(ActorsInfo.id > actor.id).first()
-    prev_link = ActorsInfo.query.order_by(ActorsInfo.id.desc()).filter(ActorsInfo.id < actor.id).first()
-    if prev_link:
-        prev = f"http://{host}:{port}/actors/{prev_link.id}"
-        links['previous'] = {'href': prev}
-    if next_link:
-        next = f"http://{host}:{port}/actors/{next_link.id}"
-        links['next'] = {'href': next}
+    prev_id, next_id = neighbour_ids(actor.id)
     pack = {'id': actor.id, 'last-update': time_to_str(actor.last_update, True),
             'name': actor.name, 'country': actor.country,
             'birthday': time_to_str(actor.birthday), 'deathday': time_to_str(actor.deathday),
-            'shows': show_list,
-            '_links': links}
-    return pack
+            'shows': show_list}
+    return {'pack': pack, 'previous': prev_id, 'next': next_id}
+
+def create_response(entry):
+    host, port = host_port()
+    links = {'self':{'href': f"http://{host}:{port}/actors/{entry['pack']['id']}"}}
+    if entry['previous']:
+        prev = f"http://{host}:{port}/actors/{entry['previous']}"
+        links['previous'] = {'href': prev}
+    if entry['next']:
+        next = f"http://{host}:{port}/actors/{entry['next']}"
+        links['next'] = {'href': next}
+    return dict(entry['pack'], _links=links)
+
+# --------------------------------------------------------------------------------------------------
+# Read-through cache of actor_entry() results, every write invalidates the actors it changes and,
+# for inserts and deletes, the neighbours whose previous/next links move
+# --------------------------------------------------------------------------------------------------
+def actor_cache():
+    return current_app.extensions['actor_cache']
+
+def actor_key(id):
+    return f'actor:{id}'
+
+def get_actor_entry(id):
+    key = actor_key(id)
+    entry = actor_cache().get(key)
+    if entry is None:
+        # taken before the query, a write invalidating the actor meanwhile makes the set a no-op
+        generation = actor_cache().generation(key)
+        actor = db.session.get(ActorsInfo, id)
+        if not actor:
+            return None
+        entry = actor_entry(actor)
+        actor_cache().set(key, entry, generation)
+    return entry
+
+def invalidate_actors(*ids):
+    actor_cache().delete(*[actor_key(id) for id in ids if id])
+
+def invalidate_with_neighbours(id):
+    invalidate_actors(id, *neighbour_ids(id))
 
 def datetime_to_year(value):
     if value != 0:
@@ -146,6 +208,93 @@ def get_update_hour(value):
 
 def get_first_number(value):
     return int(str(value)[0]+'0')
+
+def actors_list_query(order, filter):
+    order_list = []
+    for i in order:
+        order_list.append(getattr(db_finder[i[1:]], order_map[i[0]])())
+    filter_list = []
+    for j in filter:
+        filter_list.append(db_finder[j])
+    return ActorsInfo.query.with_entities(*filter_list).order_by(*order_list)
+
+def parse_changes(data):
+    """Convert a Q4 payload to column values, return (changes, error message)
+    """
+    changes = {}
+    attribute_list = ['name', 'country','gender', 'birthday', 'deathday', 'shows']
+    for value in data.keys():
+        if not value in attribute_list:
+            return None, 'Input data is invalid'
+    for i in attribute_list:
+        if data.get(i):
+            if i == 'birthday' or i == 'deathday':
+                changes[i] = str_to_time(data[i])
+            elif i == 'shows':
+                changes[i] = "@%".join(data[i])
+            elif i == 'gender':
+                if not data[i] in ['Female', 'Male', 'female', 'male', '', ' ']:
+                    return None, 'Gender can only be Female or Male'
+                changes[i] = data[i]
+            else:
+                changes[i] = data[i]
+    return changes, None
+
+# SQLite limits the number of bound parameters per statement, so id lists are sent in chunks
+BULK_CHUNK = 500
+
+def bulk_conditions(data):
+    """Yield the WHERE clauses selecting the actors addressed by the ids or the filter of a bulk payload
+    """
+    if data.get('ids'):
+        ids = [int(i) for i in data['ids']]
+        for start in range(0, len(ids), BULK_CHUNK):
+            yield ActorsInfo.id.in_(ids[start:start + BULK_CHUNK])
+    else:
+        conditions = data['filter']
+        for key in conditions:
+            if not key in ['name', 'country', 'gender']:
+                raise ValueError(key)
+        yield db.and_(*[getattr(ActorsInfo, key) == value for key, value in conditions.items()])
+
+def bulk_target_error(data):
+    if data.get('ids') and data.get('filter'):
+        return 'Give either ids or filter, not both'
+    if not data.get('ids') and not data.get('filter'):
+        return 'ids or filter is required'
+    return None
+
+def data_version():
+    """Generation of the actors data, every write bumps it through commit_changes()
+    """
+    return db.session.execute(db.text('SELECT generation FROM data_version')).scalar()
+
+def commit_changes():
+    """Commit a write together with a new data version, in the same transaction, so the
+    representation cache key changes in every worker
+    """
+    db.session.execute(db.text('UPDATE data_version SET generation = generation + 1'))
+    db.session.commit()
+
+def precompressed(view):
+    """Serve a GET from the representation cache, keyed by the request url and the data version
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = f'{request.host}{request.full_path}@{data_version()}'
+        # a profiled request always renders, a cache hit would show nothing useful
+        response = None if profiling() else cached_representation(key)
+        if response is None:
+            rv = view(*args, **kwargs)
+            if not isinstance(rv, Response):
+                rv = api.make_response(*rv)
+            response = store_representation(key, rv)
+        return response
+    return wrapper
+
+def explain(query):
+    sql = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    return [row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}'))]
 # --------------------------------------------------------------------------------------------------
 # API for Q1 and Q5
 # --------------------------------------------------------------------------------------------------
@@ -161,16 +310,10 @@ class Actors(Resource):
         """Question 1 Create an Actor in database
         """
         actor = q1_name.parse_args()['name']
-        actor_name = ''
-        for i in actor:
-            if i.isalpha() or i.isdigit():
-                actor_name += i
-            else:
-                actor_name += ' '
-        req_dict = request_data(f'https://api.tvmaze.com/search/people?q={actor_name}')
+        req_dict = request_data(search_url(actor))
         if not req_dict: return  {'message': 'The actor is not found'}, 404
-        if check_vaild_name(actor_name,req_dict):
-            ac_info = req_dict[0]['person']
+        ac_info = best_match(actor, req_dict)
+        if ac_info:
             show_list = get_show_list(ac_info['id'])
             birthday, deathday = None, None
             if ac_info['birthday']:
@@ -192,9 +335,10 @@ class Actors(Resource):
                                   last_update=now,
                                   shows=show_list)
                 db.session.add(data)
-                db.session.commit()
+                commit_changes()
                 host, port = host_port()
-                pack_id = ActorsInfo.query.filter(ActorsInfo.tvmaze_id==ac_info['id']).first().id
+                pack_id = data.id
+                invalidate_with_neighbours(pack_id)
                 pack = {'id': pack_id,
                         'last-update': str(datetime.strftime(now, "%Y-%m-%d %H:%M:%S")),
                         '_links': {'self': {
@@ -210,6 +354,7 @@ class Actors(Resource):
     @api.doc(responses={200: 'OK', 400: 'Bad Request', 404: 'Not Found'},
              description='The inputs of order and filter can be only chosen from the following list: '
                          ' {id, name, country, birthday, deathday, last-update, shows}')
+    @precompressed
     def get(self):
         """Question 5 Retrieve the list of available Actors
         """
@@ -218,27 +363,16 @@ class Actors(Resource):
             order = ['+id']
             page = 1
             size = 10
-            db_finder = {'id': 'ActorsInfo.id', 'name': 'ActorsInfo.name',
-                         'country': 'ActorsInfo.country', 'birthday': 'ActorsInfo.birthday',
-                         'deathday': 'ActorsInfo.deathday', 'last-update': 'ActorsInfo.last_update',
-                         'last_update': 'ActorsInfo.last_update', 'shows': 'ActorsInfo.shows'}
-            order_map = {'+': '.asc()', '-': '.desc()'}
             filter = ['id', 'name']
             if data['order']:
                 order = data['order'].replace(' ', '').split(',')
-            order_list = []
-            for i in order:
-                order_list.append(eval(db_finder[i[1:]] + order_map[i[0]]))
             if data['page']:
                 page = data['page']
             if data['size']:
                 size = data['size']
             if data['filter']:
                 filter = data['filter'].replace(' ', '').split(',')
-            filter_list = []
-            for j in filter:
-                filter_list.append(eval(db_finder[j]))
-            db_result = ActorsInfo.query.with_entities(*filter_list).order_by(*order_list).paginate(page, size)
+            db_result = actors_list_query(order, filter).paginate(page=page, per_page=size)
             actors_list = []
             for item in db_result.items:
                 item_set = {}
@@ -286,10 +420,10 @@ class Actors(Resource):
         """
         try:
             int(id)
-            actor = ActorsInfo.query.get(id)
-            if not actor:
+            entry = get_actor_entry(id)
+            if not entry:
                 return {'message': 'The actor is not found'}, 404
-            pack = create_response(actor)
+            pack = create_response(entry)
             return pack, 200
         except Exception:
             return {'message': 'id can only be a number'}, 400
@@ -300,11 +434,10 @@ class Actors(Resource):
         """
         try:
             int(id)
-            actor = ActorsInfo.query.get(id)
-            if not actor:
+            if not ActorsInfo.query.filter_by(id=id).delete(synchronize_session=False):
                 return {'message': 'The actor is not in database'}, 404
-            db.session.delete(actor)
-            db.session.commit()
+            commit_changes()
+            invalidate_with_neighbours(id)
             return {'message': f'The actor with id {id} was removed from the database!',
                     'id': id}, 200
         except Exception:
@@ -319,32 +452,15 @@ class Actors(Resource):
         """
         try:
             data = json.loads(request.data)
-            actor = ActorsInfo.query.filter_by(id=id)
-            isChanged = False
-            attribute_list = ['name', 'country','gender', 'birthday', 'deathday', 'shows']
-            for value in data.keys():
-                if not value in attribute_list:
-                    return {'message': 'Input data is invalid'}, 400
-            for i in attribute_list:
-                if data.get(i):
-                    if i == 'birthday' or i == 'deathday':
-                        actor.update({i: str_to_time(data[i])})
-                        isChanged = True
-                    elif i == 'shows':
-                        actor.update({i: "@%".join(data[i])})
-                        isChanged = True
-                    elif i == 'gender':
-                        if not data[i] in ['Female', 'Male', 'female', 'male', '', ' ']:
-                            return {'message': 'Gender can only be Female or Male'}, 400
-                        actor.update({i: data[i]})
-                        isChanged = True
-                    else:
-                        actor.update({i: data[i]})
-                        isChanged = True
-            if isChanged:
+            changes, message = parse_changes(data)
+            if message:
+                return {'message': message}, 400
+            if changes:
                 now = datetime.now()
-                actor.update({'last_update': now})
-                db.session.commit()
+                changes['last_update'] = now
+                ActorsInfo.query.filter_by(id=id).update(changes, synchronize_session=False)
+                commit_changes()
+                invalidate_actors(id)
                 host, port = host_port()
                 pack = {'id': id,
                         'last-update': str(datetime.strftime(now, "%Y-%m-%d %H:%M:%S")),
@@ -357,6 +473,73 @@ class Actors(Resource):
         except:
             return {'message': 'Input data is invalid'}, 400
 
+# --------------------------------------------------------------------------------------------------
+# API for bulk updates and deletes
+# Each request runs as set-based UPDATE/DELETE statements inside a single transaction
+# --------------------------------------------------------------------------------------------------
+
+@api.route('/actors/bulk', methods=['DELETE', 'PATCH'],
+           doc={'responses': {200: 'OK', 400: 'Bad Request'}})
+class Actors(Resource):
+    @api.doc(description="This operation applies the same partial update to many actors.\n"
+                         "Actors are chosen by a list of ids or by a filter on name, country and gender.\n"
+                         'Sample input:\n{"filter": {"country": "Untied States"}, "changes": {"country": "United States"}}')
+    @api.expect(q7_update, validate=True)
+    def patch(self):
+        """Bulk update Actors
+        """
+        try:
+            data = json.loads(request.data)
+            message = bulk_target_error(data)
+            if message:
+                return {'message': message}, 400
+            changes, message = parse_changes(data['changes'])
+            if message:
+                return {'message': message}, 400
+            if not changes:
+                return {'message': 'No changes have been made.', 'count': 0}, 200
+            now = datetime.now()
+            changes['last_update'] = now
+            updated_ids = []
+            for condition in bulk_conditions(data):
+                # RETURNING gives the ids the UPDATE itself matched, no separate SELECT can miss any
+                result = db.session.execute(db.update(ActorsInfo).where(condition).values(changes)
+                                            .returning(ActorsInfo.id),
+                                            execution_options={'synchronize_session': False})
+                updated_ids += result.scalars().all()
+            commit_changes()
+            invalidate_actors(*updated_ids)
+            count = len(updated_ids)
+            return {'message': f'{count} actors were updated', 'count': count,
+                    'last-update': time_to_str(now, True)}, 200
+        except Exception:
+            db.session.rollback()
+            return {'message': 'Input data is invalid'}, 400
+
+    @api.doc(description="This operation deletes many actors, chosen by a list of ids or by a filter "
+                         "on name, country and gender.")
+    @api.expect(q7_delete, validate=True)
+    def delete(self):
+        """Bulk delete Actors
+        """
+        try:
+            data = json.loads(request.data)
+            message = bulk_target_error(data)
+            if message:
+                return {'message': message}, 400
+            count = 0
+            for condition in bulk_conditions(data):
+                count += db.session.execute(db.delete(ActorsInfo).where(condition),
+                                            execution_options={'synchronize_session': False}).rowcount
+            commit_changes()
+            # the previous/next links of any remaining actor may have moved
+            if count:
+                actor_cache().clear()
+            return {'message': f'{count} actors were removed from the database!', 'count': count}, 200
+        except Exception:
+            db.session.rollback()
+            return {'message': 'Input data is invalid'}, 400
+
 # --------------------------------------------------------------------------------------------------
 # API for Q6
 # --------------------------------------------------------------------------------------------------
@@ -364,6 +547,7 @@ class Actors(Resource):
 @api.route('/actors/statistics', doc={'responses': {200: 'OK', 400: 'Bad Request', 404: 'Not Found'}})
 class Actors(Resource):
     @api.expect(q6_param)
+    @precompressed
     def get(self):
         """ Question 6  Get the statistics of the existing Actors
         """
@@ -483,10 +667,86 @@ class Actors(Resource):
                 plt.savefig(save_file, format='png')
                 img = save_file.getvalue()
                 plt.close()
-                return send_file(BytesIO(img), mimetype='image/png')
+                return Response(img, mimetype='image/png')
         except:
             return {'message': 'Input data is invalid'}, 400
 
+# --------------------------------------------------------------------------------------------------
+# Maintenance commands, run with: flask --app z3457800 <command>
+# --------------------------------------------------------------------------------------------------
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db():
+    """Apply the pending schema migrations"""
+    applied = upgrade(db.engine)
+    click.echo(f'Applied migrations: {applied}' if applied else 'Database is up to date')
+
+@click.command('check-indexes')
+@with_appcontext
+def check_indexes():
+    """EXPLAIN the Q5 list query for every order spec and report the ones that sort in a temp B-tree"""
+    # shows is left unindexed on purpose (migration 2), so it is not checked
+    order_specs = [[sign + column] for column in ['id', 'name', 'country', 'birthday', 'deathday',
+                                                  'last-update'] for sign in order_map]
+    order_specs += [['+country', '+name'], ['-country', '-name'], ['+birthday', '+name'], ['-birthday', '-name']]
+    failed = []
+    for order in order_specs:
+        spec = ','.join(order)
+        plan = explain(actors_list_query(order, ['id', 'name']).limit(10))
+        uses_sort = any('TEMP B-TREE' in step for step in plan)
+        if uses_sort:
+            failed.append(spec)
+        click.echo(f"{'SORT' if uses_sort else 'OK':<5}{spec:<22}{'; '.join(plan)}")
+    if failed:
+        raise click.ClickException(f"Order specs not served by an index: {', '.join(failed)}")
+
+# --------------------------------------------------------------------------------------------------
+# Application factory
+# Engines are created lazily inside each process, so call create_app() after forking (gunicorn.conf.py)
+# --------------------------------------------------------------------------------------------------
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    # the migrations, the pool settings and the shared cache all rely on SQLite
+    if make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name() != 'sqlite':
+        raise ValueError('DATABASE_URL must be a SQLite database, eg: sqlite:////srv/actors.db')
+    db.init_app(app)
+    api.init_app(app)
+    # registered before compression so the profile also covers compressing the response
+    init_profiling(app, db)
+    init_compression(app)
+    app.extensions['actor_cache'] = make_cache(app.config['ACTOR_CACHE_BACKEND'], app.config['ACTOR_CACHE_PATH'],
+                                               app.config['ACTOR_CACHE_SIZE'], app.config['ACTOR_CACHE_TTL'])
+    app.cli.add_command(upgrade_db)
+    app.cli.add_command(check_indexes)
+    return app
+
+def warm_up(app, workers=1):
+    """Check the schema is current, open the first pooled connection and the actor cache and
+    load the most recently updated actors into it, run once per process. Migrating is left to
+    upgrade(), run once before the workers start
+    """
+    if workers > 1 and app.config['ACTOR_CACHE_BACKEND'] == 'memory':
+        raise RuntimeError('ACTOR_CACHE_BACKEND "memory" cannot be used with several workers, use "shared"')
+    with app.app_context():
+        with db.engine.connect() as conn:
+            version = current_version(conn)
+        if version != LATEST_VERSION:
+            raise RuntimeError(f'Database schema is at version {version}, expected {LATEST_VERSION}. '
+                               'Run: flask --app z3457800 upgrade-db')
+        app.extensions['actor_cache'].purge_expired()
+        if app.config['ACTOR_CACHE_BACKEND'] != 'none':
+            # walks the last_update index, with a shared cache the later workers mostly find hits
+            recent = (ActorsInfo.query.with_entities(ActorsInfo.id).order_by(ActorsInfo.last_update.desc())
+                      .limit(app.config['ACTOR_CACHE_PRIME']))
+            for (id,) in recent.all():
+                get_actor_entry(id)
+
 if __name__ == '__main__':
-    db.create_all()
+    app = create_app()
+    with app.app_context():
+        upgrade(db.engine)
+    warm_up(app)
     app.run(debug=True)
\ No newline at end of file